@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+import time
+
+from chemical_network_examples import examples
+from necessary_condition import (SEARCH_STRATEGIES, construct_contribution_graph,
+                                 construct_influence_graph, parse_reactions,
+                                 retrieve_cycles_info, split_reactions,
+                                 test_hoopings)
+
+# Maximal time to import necessary_condition in a fresh interpreter, in seconds
+IMPORT_BUDGET = 0.05
+
+"""
+    benchmark_strategies(examples, strategies=SEARCH_STRATEGIES, repeat=3)
+
+Time the hooping search of each example for each search strategy. The influence
+graph and cycles are computed once per example, so that only the search itself
+is measured. For multistable networks this is the time to the first witness.
+
+Return a list of dictionnaries, one per example and strategy, with the best
+time over `repeat` runs.
+"""
+def benchmark_strategies(examples, strategies=SEARCH_STRATEGIES, repeat=3):
+    rows = []
+
+    for ex in examples:
+        species, reactions = parse_reactions(split_reactions(ex["network"]))
+        contribution_graph = construct_contribution_graph(species, reactions)
+        GI = construct_influence_graph(contribution_graph)
+        cycles_info = retrieve_cycles_info(GI)
+
+        for strategy in strategies:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = test_hoopings(reactions, cycles_info, strategy=strategy)
+                times.append(time.perf_counter() - start)
+
+            rows.append(dict(
+                name=ex["name"],
+                strategy=strategy,
+                possible_multistability=result["possible_multistability"],
+                hoopings_tested=result["hoopings_tested"],
+                time=min(times)
+            ))
+
+    return rows
+
+
+"""
+    cold_import_time(repeat=5)
+
+Return the best time over `repeat` runs to import `necessary_condition` in a
+fresh interpreter.
+"""
+def cold_import_time(repeat=5):
+    code = ("import time\n"
+            "start = time.perf_counter()\n"
+            "import necessary_condition\n"
+            "print(time.perf_counter() - start)")
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], check=True, text=True,
+                             capture_output=True, cwd=cwd).stdout
+        times.append(float(out))
+
+    return min(times)
+
+
+def main():
+    status = 0
+
+    elapsed = cold_import_time()
+    print("Cold import of necessary_condition: {:.1f} ms (budget {:.0f} ms)\n".format(
+        1000*elapsed, 1000*IMPORT_BUDGET))
+
+    if elapsed > IMPORT_BUDGET:
+        print("Cold import is over budget", file=sys.stderr)
+        status = 1
+
+    rows = benchmark_strategies(examples)
+
+    print("{:<40} {:<14} {:<8} {:>10} {:>12}".format(
+        "Network", "Strategy", "Witness", "Tested", "Time (ms)"))
+
+    for row in rows:
+        print("{:<40} {:<14} {:<8} {:>10} {:>12.3f}".format(
+            row["name"], row["strategy"], str(row["possible_multistability"]),
+            row["hoopings_tested"], 1000*row["time"]))
+
+    # Switching strategies must never change the verdict
+    verdicts = {}
+    for row in rows:
+        verdicts.setdefault(row["name"], set()).add(row["possible_multistability"])
+
+    inconsistent = [name for name, v in verdicts.items() if len(v) > 1]
+    if len(inconsistent) > 0:
+        print("Strategies disagree for: {}".format(", ".join(inconsistent)), file=sys.stderr)
+        status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,22 @@
 import re
+import sys
 
-import networkx as nx
-import numpy as np
-
-from collections import OrderedDict
-from itertools import product, chain
-from numpy.linalg import det
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+from itertools import chain, combinations, count, product
 
 from utils import pairs
 
+# networkx and numpy are only imported inside the functions that need them, so
+# that importing this module (e.g. from short-lived batch workers) stays cheap.
+
 
-def test_multistability(reaction_data):
+def test_multistability(reaction_data, strategy="breadth_first"):
     species, reactions = parse_reactions(reaction_data)
     contribution_graph = construct_contribution_graph(species, reactions)
     GI = construct_influence_graph(contribution_graph)
     cycles_info = retrieve_cycles_info(GI)
-    return test_hoopings(reactions, cycles_info), GI
+    return test_hoopings(reactions, cycles_info, strategy=strategy), GI
 
 
 """
@@ -147,6 +148,8 @@ def parse_side(side):
     return {c[1]:c[0] for c in complexes}
 
 def construct_contribution_graph(species, reactions):
+    import networkx as nx
+
     G = nx.DiGraph()
     G.add_nodes_from(species)
 
@@ -163,25 +166,43 @@ def construct_contribution_graph(species, reactions):
 
 
 def construct_influence_graph(contribution_graph):
+    import networkx as nx
+
     GI = nx.DiGraph()  # Interaction graph
     GI.add_nodes_from(contribution_graph.nodes)
 
     for s1, s2, contributions in contribution_graph.edges(data="contributions"):
-        vals = contributions.values()
-        if all([v > 0 for v in vals]):
-            sign = +1
-        elif all([v < 0 for v in vals]):
-            sign = -1
-        else:
-            sign = 0  # Impossible to determine the sign without knowing the kinetic
-
-        GI.add_edge(s1, s2, sign=sign, reactions=list(contributions.keys()))
+        GI.add_edge(s1, s2,
+                    sign=influence_sign(contributions),
+                    reactions=list(contributions.keys()))
 
     return GI
 
 
+"""
+    influence_sign(contributions)
+
+Return the sign of an influence edge given the contributions of the reactions
+supporting it, as a dictionnary mapping reaction names to stoichiometric balance.
+"""
+def influence_sign(contributions):
+    vals = contributions.values()
+    if all([v > 0 for v in vals]):
+        return +1
+    elif all([v < 0 for v in vals]):
+        return -1
+    else:
+        return 0  # Impossible to determine the sign without knowing the kinetic
+
+
 def retrieve_cycles_info(GI):
+    import networkx as nx
+
     cycles = [tuple(c) for c in nx.simple_cycles(GI)] # Convert cycle to tuple to be able to use them as key
+
+    # The first node of each cycle returned by networkx depends on the hash
+    # seed, always start from the smallest one instead
+    cycles = [c[c.index(min(c)):] + c[:c.index(min(c))] for c in cycles]
     cycles_info = []
 
     # Cycles are found as sequence of nodes, all possible edge combination
@@ -205,62 +226,408 @@ def retrieve_cycles_info(GI):
     return cycles_info
 
 
-def extend_hooping(hooping, cycles):
-    used = set(chain.from_iterable(hooping))
-    compat = [(k, c) for k, c in enumerate(cycles) if len(used.intersection(c)) == 0]
-    return [hooping + [c] for c in compat]
+"""
+    extend_hooping(hooping, cycles)
 
+Return all hoopings obtained by adding to `hooping` (a list of indices in
+`cycles`) a cycle coming after its last cycle and disjoint from all its cycles.
+Each set of disjoint cycles is thus generated exactly once.
+"""
+def extend_hooping(hooping, cycles):
+    used = set(chain.from_iterable(cycles[i]["cycle"] for i in hooping))
+    return [hooping + [j] for j in range(hooping[-1] + 1, len(cycles))
+            if used.isdisjoint(cycles[j]["cycle"])]
 
-def test_hoopings(reactions, cycles):
-    multistability = False
 
-    cycles = sorted(cycles, key=lambda c: (c["sign"], len(c["cycle"])), reverse=True)
+"""
+    breadth_first_hoopings(reactions, cycles)
 
-    n = 0
+Yield hoopings (as lists of indices in `cycles`) starting from each cycle of
+non negative sign in turn, and exploring all extensions of a cycle breadth
+first before moving to the next one.
+"""
+def breadth_first_hoopings(reactions, cycles):
     for k, c in enumerate(cycles):
         # Since cycles are sorted, once we reach a cycle of negative sign, only negative sign cycles remain in the list.
         # Therefore, the hoopings build from them will never contain a positive sign cycle.
         if c["sign"] < 0:
             break
 
-        queue = [[c]]
+        queue = deque([[k]])
 
         while len(queue) > 0:
-            hooping = queue.pop(0)
-            species = list(chain.from_iterable([subcycle["cycle"] for subcycle in hooping]))
-
-            # Find all possible combination of reactions
-            for subpaths in product(*[subcycle["paths"] for subcycle in hooping]):
-                n += 1
-
-                # PERF using a numpy array of fixed size may help
-                Rs = list(chain.from_iterable(subpaths))
-                stoch = []
-                for R in Rs:
-                    stoch.append([reactions[R]["balance"].get(spec, 0) for spec in species])
-
-                # TOFIX det always return a float, risk of imprecision breaking the code
-                d = det(stoch)
-                if d != 0:
-                    multistability = True
-                    return dict(
-                        possible_multistability=True,
-                        hooping=tuple(subcycle["cycle"] for subcycle in hooping),
-                        path=subpaths,
-                        det=d,
-                        hoopings_tested=n,
-                    )
-
-            # PERF using a view on cycles may increase performance here
-            queue.extend(extend_hooping(hooping, cycles[k+1:]))
-
-    if not multistability:
+            hooping = queue.popleft()
+            yield hooping
+            queue.extend(extend_hooping(hooping, cycles))
+
+
+"""
+    best_first_hoopings(reactions, cycles)
+
+Yield the same hoopings as `breadth_first_hoopings`, but explore them through a
+priority queue, most promising hooping first according to `hooping_score`.
+"""
+def best_first_hoopings(reactions, cycles):
+    heap = []
+    counter = count()  # Tie breaker keeping the order stable
+
+    for k, c in enumerate(cycles):
+        if c["sign"] < 0:
+            break
+        heappush(heap, (hooping_score(cycles, [k]), next(counter), [k]))
+
+    while len(heap) > 0:
+        _, _, hooping = heappop(heap)
+        yield hooping
+
+        for extended in extend_hooping(hooping, cycles):
+            heappush(heap, (hooping_score(cycles, extended), next(counter), extended))
+
+
+"""
+    hooping_score(cycles, hooping)
+
+Return the priority of a hooping for `best_first_hoopings`, lower is better:
+hoopings with more positive cycles come first, then the ones covering more
+species and the ones with more candidate paths. Only cheap quantities are used,
+the rank of the hooping is checked by `hooping_witnesses` once it is popped.
+"""
+def hooping_score(cycles, hooping):
+    subcycles = [cycles[i] for i in hooping]
+    positive = sum(1 for c in subcycles if c["sign"] > 0)
+    nspecies = sum(len(c["cycle"]) for c in subcycles)
+    npaths = 1
+    for c in subcycles:
+        npaths *= len(c["paths"])
+
+    return (-positive, -nspecies, -npaths)
+
+
+"""
+    rank_deficit(reactions, hooping)
+
+Return the number of species of `hooping` (a list of cycles) minus the rank of
+the stoichiometric matrix of all the reactions on its paths. Every matrix built
+from a choice of paths only uses rows of this matrix, so a hooping with a non
+zero rank deficit can not lead to a non zero determinant. Its extensions still
+may.
+"""
+def rank_deficit(reactions, hooping):
+    from numpy.linalg import matrix_rank
+
+    species = list(chain.from_iterable(c["cycle"] for c in hooping))
+    Rs = set(chain.from_iterable(chain.from_iterable(c["paths"] for c in hooping)))
+    stoch = [[reactions[R]["balance"].get(spec, 0) for spec in species] for R in sorted(Rs)]
+
+    return len(species) - matrix_rank(stoch)
+
+
+SEARCH_STRATEGIES = OrderedDict(
+    breadth_first=breadth_first_hoopings,
+    best_first=best_first_hoopings
+)
+
+
+"""
+    hooping_witnesses(reactions, cycles, strategy="breadth_first")
+
+Yield all the hoopings and choices of reactions along their cycles giving a non
+zero determinant, as tuples `(hooping, path, det, n)` where `hooping` is a list
+of cycles and `n` the number of determinants computed so far. Return the total
+number of determinants computed once exhausted.
+
+`strategy` is either the name of one of the `SEARCH_STRATEGIES` or a generator
+function with the same signature, yielding candidate hoopings as lists of
+indices in the sorted list of cycles. The strategy only changes the order in
+which hoopings are tested, not the witnesses found.
+"""
+def hooping_witnesses(reactions, cycles, strategy="breadth_first"):
+    from numpy.linalg import det
+
+    if isinstance(strategy, str):
+        if strategy not in SEARCH_STRATEGIES:
+            raise ValueError("unknown search strategy '{}'. Available strategies "
+                             "are {}.".format(strategy, list(SEARCH_STRATEGIES)))
+        strategy = SEARCH_STRATEGIES[strategy]
+
+    # Cycles are compared last to make the order of the search reproducible
+    cycles = sorted(cycles, key=lambda c: (c["sign"], len(c["cycle"]), c["cycle"]), reverse=True)
+
+    n = 0
+    for indices in strategy(reactions, cycles):
+        hooping = [cycles[i] for i in indices]
+        species = list(chain.from_iterable([subcycle["cycle"] for subcycle in hooping]))
+
+        # Skip hoopings for which all determinants are zero, unless there is
+        # only one to compute anyway
+        npaths = 1
+        for subcycle in hooping:
+            npaths *= len(subcycle["paths"])
+
+        if npaths > 1 and rank_deficit(reactions, hooping) > 0:
+            continue
+
+        # Find all possible combination of reactions
+        for subpaths in product(*[subcycle["paths"] for subcycle in hooping]):
+            n += 1
+
+            # PERF using a numpy array of fixed size may help
+            Rs = list(chain.from_iterable(subpaths))
+            stoch = []
+            for R in Rs:
+                stoch.append([reactions[R]["balance"].get(spec, 0) for spec in species])
+
+            # TOFIX det always return a float, risk of imprecision breaking the code
+            d = det(stoch)
+            if d != 0:
+                yield hooping, subpaths, d, n
+
+    return n
+
+
+"""
+    test_hoopings(reactions, cycles, strategy="breadth_first")
+
+Search for a hooping and a choice of reactions along its cycles giving a non
+zero determinant, see `hooping_witnesses`, and return the first one found.
+"""
+def test_hoopings(reactions, cycles, strategy="breadth_first"):
+    witnesses = hooping_witnesses(reactions, cycles, strategy=strategy)
+
+    try:
+        hooping, subpaths, d, n = next(witnesses)
+    except StopIteration as stop:
         return dict(
             possible_multistability=False,
             hooping=None,
             path=None,
             det=None,
-            hoopings_tested=n
+            hoopings_tested=stop.value
         )
 
-    return True
+    return dict(
+        possible_multistability=True,
+        hooping=tuple(subcycle["cycle"] for subcycle in hooping),
+        path=subpaths,
+        det=d,
+        hoopings_tested=n,
+    )
+
+
+"""
+    knockout_scan(reaction_data, knockouts=None, size=1, processes=1, strategy="breadth_first")
+
+Test the possibility of multistability for every network obtained by deleting
+a set of reactions. `knockouts` is an iterable of collections of reaction names
+(as used in the reaction dictionnary, e.g. `"bindA+"` for the forward part of a
+reversible reaction). If omitted, all combinations of `size` reactions are
+deleted.
+
+Deleting reactions only removes cycles and paths, and does not change the
+balance of the remaining reactions. The witnesses of a knockout (see
+`hooping_witnesses`) are thus the witnesses of the full network that use none of
+the deleted reactions and still contain a cycle of non negative sign. Only the
+signs of the edges whose contributions changed are recomputed for each
+knockout. `strategy` gives the order in which the witnesses of the full network
+are searched.
+
+By default (`processes=1`) the witnesses are searched lazily, only as far as
+needed by the knockouts. Otherwise all the witnesses of the full network are
+first searched in this process, then sent to `processes` worker processes (all
+available CPUs if `None`) filtering them for each knockout. This only pays off
+when the knockouts are many, and the full search of the network cheap compared
+to filtering the witnesses for all of them.
+
+Return a list with one dictionnary per knockout, containing the deleted
+reactions under the key `knockout` and a result in the format of
+`test_hoopings`. `hoopings_tested` counts the determinants computed on the full
+network before reaching the witness.
+"""
+def knockout_scan(reaction_data, knockouts=None, size=1, processes=1,
+                  strategy="breadth_first"):
+    species, reactions = parse_reactions(reaction_data)
+    contribution_graph = construct_contribution_graph(species, reactions)
+    GI = construct_influence_graph(contribution_graph)
+    cycles_info = retrieve_cycles_info(GI)
+
+    if knockouts is None:
+        knockouts = combinations(reactions.keys(), size)
+
+    knockouts = [tuple(knockout) for knockout in knockouts]
+
+    for knockout in knockouts:
+        for R in knockout:
+            if R not in reactions:
+                raise ValueError("unknown reaction '{}' in knockout {}."
+                                 "".format(R, knockout))
+
+    edges = {(s1, s2): contributions for s1, s2, contributions
+             in contribution_graph.edges(data="contributions")}
+    signs = {(s1, s2): sign for s1, s2, sign in GI.edges(data="sign")}
+
+    index = _knockout_index(reactions, edges, signs, cycles_info, strategy)
+
+    if processes == 1:
+        results = [_test_knockout(index, knockout) for knockout in knockouts]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Search all witnesses once, the paused search can not be sent anyway
+        for _ in _knockout_witnesses(index):
+            pass
+        index["witnesses"] = None
+
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_init_knockout_worker,
+                                 initargs=(index,)) as executor:
+            results = list(executor.map(_test_knockout_in_worker, knockouts,
+                                        chunksize=max(1, len(knockouts)//64)))
+
+    return [dict(knockout=knockout, **result)
+            for knockout, result in zip(knockouts, results)]
+
+
+"""
+    _knockout_index(reactions, edges, signs, cycles_info, strategy)
+
+Return the data shared by all the knockouts of `knockout_scan`. `edges` and
+`signs` map the edges of the influence graph to their contributions and sign.
+"""
+def _knockout_index(reactions, edges, signs, cycles_info, strategy):
+    # Edges supported by each reaction, so that a knockout only visits the
+    # edges it affects
+    reaction_edges = {R: [] for R in reactions}
+    for e, contributions in edges.items():
+        for R in contributions:
+            reaction_edges[R].append(e)
+
+    return dict(
+        edges=edges,
+        signs=signs,
+        reaction_edges=reaction_edges,
+        witnesses=hooping_witnesses(reactions, cycles_info, strategy=strategy),
+        found=[],  # Witnesses of the full network found so far
+        tested=None  # Total number of determinants, once all witnesses are found
+    )
+
+
+# Shared by the knockout worker processes, set once per process to avoid
+# sending the witnesses with every knockout
+_worker_index = None
+
+
+def _init_knockout_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _test_knockout_in_worker(knockout):
+    return _test_knockout(_worker_index, knockout)
+
+
+"""
+    _knockout_witnesses(index)
+
+Iterate over the witnesses of the full network, reusing the ones found for
+previous knockouts and searching for more only when they are exhausted.
+"""
+def _knockout_witnesses(index):
+    yield from index["found"]
+
+    while index["tested"] is None:
+        try:
+            hooping, subpaths, d, n = next(index["witnesses"])
+        except StopIteration as stop:
+            index["tested"] = stop.value
+            return
+
+        witness = dict(
+            hooping=tuple(subcycle["cycle"] for subcycle in hooping),
+            path=subpaths,
+            det=d,
+            hoopings_tested=n,
+            reactions=set(chain.from_iterable(subpaths)),
+            positive=any(subcycle["sign"] > 0 for subcycle in hooping),
+            # The sign of these cycles may become positive or negative
+            undetermined=[list(pairs(subcycle["cycle"])) for subcycle in hooping
+                          if subcycle["sign"] == 0]
+        )
+        index["found"].append(witness)
+        yield witness
+
+
+def _test_knockout(index, knockout):
+    signs = index["signs"]
+    removed = set(knockout)
+
+    # Recompute the sign of the edges whose contributions changed. The edges
+    # used by a witness avoiding the knockout always keep some contribution.
+    changed_signs = {}
+    for e in chain.from_iterable(index["reaction_edges"][R] for R in removed):
+        remaining = {R: v for R, v in index["edges"][e].items() if R not in removed}
+        if len(remaining) > 0:
+            changed_signs[e] = influence_sign(remaining)
+
+    for witness in _knockout_witnesses(index):
+        if not removed.isdisjoint(witness["reactions"]):
+            continue
+
+        # Cycles of negative sign stay negative when reactions are deleted, the
+        # hooping is only searched if one of its cycles is still non negative
+        admissible = witness["positive"]
+        for cycle_edges in witness["undetermined"]:
+            sign = 1
+            for e in cycle_edges:
+                sign *= changed_signs.get(e, signs[e])
+            admissible = admissible or sign >= 0
+
+        if admissible:
+            return dict(
+                possible_multistability=True,
+                hooping=witness["hooping"],
+                path=witness["path"],
+                det=witness["det"],
+                hoopings_tested=witness["hoopings_tested"]
+            )
+
+    return dict(
+        possible_multistability=False,
+        hooping=None,
+        path=None,
+        det=None,
+        hoopings_tested=index["tested"]
+    )
+
+
+"""
+    main(argv=None)
+
+Command line entry point. Analyze the chemical network described in the file
+given as first argument (one reaction per line, same syntax as the examples)
+and print the result of `test_multistability` as JSON. Only the analysis core is
+used, no plotting or widget code is imported.
+"""
+def main(argv=None):
+    import json
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if len(argv) != 1:
+        print("usage: python necessary_condition.py REACTION_FILE", file=sys.stderr)
+        return 2
+
+    with open(argv[0]) as file:
+        reaction_data = split_reactions(file.read())
+
+    result, _ = test_multistability(reaction_data)
+
+    if result["det"] is not None:
+        result["det"] = float(result["det"])
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import necessary_condition as nc
+
+from chemical_network_examples import examples
+
+
+# Every single cycle of non negative sign has a zero determinant. The network is
+# symmetric in B and C, and the only witnesses are the hoopings made of the two
+# disjoint cycles (A, B) and (C,), or (A, C) and (B,).
+two_cycles_network = """
+    R1: A -> B + C
+    R2: B -> A
+    R3: C -> A
+"""
+
+
+def analyze(network, **kwargs):
+    result, _ = nc.test_multistability(nc.split_reactions(network), **kwargs)
+    return result
+
+
+@pytest.mark.parametrize("strategy", list(nc.SEARCH_STRATEGIES))
+@pytest.mark.parametrize("example", examples, ids=lambda ex: ex["name"])
+def test_examples(example, strategy):
+    result = analyze(example["network"], strategy=strategy)
+    assert result["possible_multistability"] == example["multistability"]
+
+
+def test_extend_hooping():
+    cycles = [dict(cycle=("A", "B")), dict(cycle=("C",)), dict(cycle=("B", "C")), dict(cycle=("D",))]
+
+    assert nc.extend_hooping([0], cycles) == [[0, 1], [0, 3]]
+    assert nc.extend_hooping([0, 1], cycles) == [[0, 1, 3]]
+    assert nc.extend_hooping([1], cycles) == [[1, 3]]  # Earlier cycles are never added back
+    assert nc.extend_hooping([3], cycles) == []
+
+
+@pytest.mark.parametrize("strategy", list(nc.SEARCH_STRATEGIES))
+def test_hooping_of_several_cycles(strategy):
+    result = analyze(two_cycles_network, strategy=strategy)
+
+    assert result["possible_multistability"]
+    assert sorted(result["hooping"]) in [[("A", "B"), ("C",)], [("A", "C"), ("B",)]]
+
+
+def test_cold_import():
+    # Fresh interpreter, so that nothing is already loaded
+    code = "import sys, necessary_condition; print(' '.join(sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], check=True, text=True,
+                         capture_output=True, cwd=os.path.dirname(os.path.abspath(nc.__file__))).stdout
+    modules = out.split()
+
+    for heavy in ["numpy", "networkx", "matplotlib", "ipywidgets", "tkinter"]:
+        assert heavy not in modules
+
+
+def knocked_out(network, knockout):
+    species, reactions = nc.parse_reactions(nc.split_reactions(network))
+    for R in knockout:
+        del reactions[R]
+
+    contribution_graph = nc.construct_contribution_graph(species, reactions)
+    GI = nc.construct_influence_graph(contribution_graph)
+    return nc.test_hoopings(reactions, nc.retrieve_cycles_info(GI))
+
+
+@pytest.mark.parametrize("strategy", list(nc.SEARCH_STRATEGIES))
+@pytest.mark.parametrize("example", examples[:5] + [dict(network=two_cycles_network, name="Two cycles")],
+                         ids=lambda ex: ex["name"])
+def test_knockout_scan(example, strategy):
+    results = nc.knockout_scan(nc.split_reactions(example["network"]), size=2,
+                               processes=1, strategy=strategy)
+
+    for result in results:
+        expected = knocked_out(example["network"], result["knockout"])
+        assert result["possible_multistability"] == expected["possible_multistability"]
+
+
+def test_knockout_scan_processes():
+    reaction_data = nc.split_reactions(examples[0]["network"])
+    serial = nc.knockout_scan(reaction_data, size=2)
+
+    # The strategy is only used in this process, it does not need to be picklable
+    strategy = lambda reactions, cycles: nc.best_first_hoopings(reactions, cycles)
+    pooled = nc.knockout_scan(reaction_data, size=2, processes=2, strategy=strategy)
+
+    assert ([r["possible_multistability"] for r in serial]
+            == [r["possible_multistability"] for r in pooled])
+
+
+def test_knockout_scan_errors():
+    reaction_data = nc.split_reactions(two_cycles_network)
+
+    with pytest.raises(ValueError):
+        nc.knockout_scan(reaction_data, knockouts=[("R4",)])